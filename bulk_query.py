@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Bulk A lookups for partB.py / partD.py, run inside a Mininet host so queries leave from its namespace.
+
+Usage: python3 bulk_query.py <server_ip> <concurrency> [port]
+
+Stays up between batches: each batch is one domain per line on stdin ended by a blank line.
+The domains are resolved concurrently with dnspython, one line is printed per answer as
+"domain<TAB>latency_s<TAB>success<TAB>response_bytes<TAB>comma-separated addresses",
+then BATCH_END. EOF on stdin between batches exits. response_bytes is the length of the answer
+as dnspython re-encodes it, which can differ from the datagram received (e.g. in how names are compressed).
+"""
+import asyncio
+import sys
+import time
+import dns.asyncresolver
+import dns.exception
+
+BATCH_END = "__END__"
+
+
+async def main(server, limit, port):
+    res = dns.asyncresolver.Resolver(configure=False)
+    res.nameservers = [server]
+    res.port = port
+    res.timeout = 2   # like dig +time=2
+    res.lifetime = 6  # and dig's default three tries
+    sem = asyncio.Semaphore(limit)
+
+    async def one(domain):
+        async with sem:
+            start = time.perf_counter_ns()
+            latency = None
+            size = 0
+            try:
+                answer = await res.resolve(domain, "A")
+                addrs = ",".join(rd.address for rd in answer)
+                size = len(answer.response.to_wire())
+                # On-wire time of the exchange that was answered, like dig's ";; Query time"
+                latency = getattr(answer.response, "time", None)
+            except dns.exception.DNSException:
+                addrs = ""
+            if latency is None:
+                latency = (time.perf_counter_ns() - start) / 1e9
+        print("%s\t%.6f\t%d\t%d\t%s" % (domain, latency, 1 if addrs else 0, size, addrs), flush=True)
+
+    while True:
+        domains = []
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                break
+            domains.append(line)
+        else:
+            if not domains:
+                return  # stdin closed between batches
+        await asyncio.gather(*(one(d) for d in domains))
+        print(BATCH_END, flush=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 53))
@@ -1,61 +1,71 @@
 #!/usr/bin/env python3
+import array
+import os
 import sys
-import subprocess
 import time
-import statistics
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import dns.exception
+import dns.resolver
+import numpy as np
+from scapy.all import DNS, PcapReader
+from scapy.error import Scapy_Exception
+
+def _query_names(reader):
+    for pkt in reader:
+        if not pkt.haslayer(DNS):
+            continue
+        layer = pkt[DNS]
+        if layer.qr == 0 and layer.qd:
+            yield layer.qd[0].qname.decode("utf-8", errors="ignore").strip(" .")
 
 def extract_domains_from_pcap(pcap_file):
-    """Extracts unique DNS query domains from a PCAP using TShark."""
+    """Extracts unique DNS query domains by reading the PCAP directly with Scapy."""
     try:
-        tshark_cmd = [
-            "tshark",
-            "-r", pcap_file,
-            "-Y", "dns.flags.response == 0 && dns.qry.name",
-            "-T", "fields",
-            "-e", "dns.qry.name"
-        ]
-        proc = subprocess.run(tshark_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        output = proc.stdout.decode("utf-8").splitlines()
+        with PcapReader(pcap_file) as reader:
+            # dict.fromkeys de-duplicates in C while keeping first-seen order
+            return list(dict.fromkeys(d for d in _query_names(reader) if d))
     except FileNotFoundError:
-        print("ERROR: TShark not installed.", file=sys.stderr)
+        print("ERROR: PCAP file not found:", pcap_file, file=sys.stderr)
         return []
-    except subprocess.CalledProcessError as e:
-        print("ERROR running TShark:", e.stderr.decode("utf-8"), file=sys.stderr)
+    except Scapy_Exception as e:
+        print("ERROR reading PCAP:", e, file=sys.stderr)
         return []
 
-    seen = set()
-    domains = []
-    for d in output:
-        d = d.strip().strip(".")
-        if d and d not in seen:
-            domains.append(d)
-            seen.add(d)
-    return domains
+def make_resolver(resolver_ip, port):
+    """Build a dnspython resolver that only talks to the given server."""
+    res = dns.resolver.Resolver(configure=False)
+    res.nameservers = [resolver_ip]
+    res.port = port
+    res.timeout = 5
+    res.lifetime = 5
+    return res
 
-def send_query_with_dig(domain, resolver_ip, port):
-    """Send a single DNS query using dig and measure latency."""
-    dig_cmd = ["dig", "@%s" % resolver_ip, "-p", str(port), domain, "+time=5", "+tries=1", "+short"]
-    start = time.time()
+def send_query(res, domain):
+    """Send a single A query in-process and measure latency."""
+    start = time.perf_counter()
     try:
-        proc = subprocess.run(dig_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=6)
-        print(proc)
-        latency = time.time() - start
-        output = proc.stdout.decode("utf-8").strip()
-        success = bool(output)
-    except subprocess.TimeoutExpired:
+        res.resolve(domain, "A")
+        success = True
+    except dns.exception.Timeout:
         print("Query for %s timed out." % domain)
-        latency = 5.0
         success = False
+    except dns.exception.DNSException:
+        success = False
+    latency = time.perf_counter() - start
     return latency, success
 
-def compute_metrics(results):
-    total = len(results)
-    success_count = sum(1 for r in results if r["success"])
+def compute_metrics(latencies, success):
+    """latencies is an array('d') and success a parallel bytearray of 0/1 flags."""
+    total = len(latencies)
+    success_count = sum(success)
     fail_count = total - success_count
-    latencies = [r["latency"] for r in results if r["success"]]
-    avg_latency = statistics.mean(latencies) if latencies else 0
+    all_lat = np.frombuffer(latencies, dtype=np.float64)
+    ok = np.frombuffer(success, dtype=np.uint8).astype(bool)
+    lat = all_lat[ok]
+    avg_latency = float(lat.mean()) if lat.size else 0.0
+    p50, p95 = (float(p) for p in np.percentile(lat, [50, 95])) if lat.size else (0.0, 0.0)
     total_bytes = success_count * 100.0
-    total_time = sum(r["latency"] for r in results)
+    total_time = float(all_lat.sum())
     throughput = (total_bytes / total_time) if total_time > 0 else 0
 
     return {
@@ -63,6 +73,8 @@ def compute_metrics(results):
         "successful_queries": success_count,
         "failed_queries": fail_count,
         "avg_latency_s": round(avg_latency, 4),
+        "p50_latency_s": round(p50, 4),
+        "p95_latency_s": round(p95, 4),
         "throughput_Bps": int(throughput)
     }
 
@@ -91,14 +103,21 @@ def main():
         sys.exit(0)
     print("Found %d unique queries." % len(domains))
 
-    results = []
+    latencies = array.array('d')
+    success_flags = bytearray()
     total = len(domains)
-    for count, domain in enumerate(domains, 1):
-        latency, success = send_query_with_dig(domain, resolver_ip, port)
-        results.append({"latency": latency, "success": success})
-        progress_bar("Querying", count, total)
+    res = make_resolver(resolver_ip, port)
+    # queries are network-bound, so a thread per in-flight query is enough to overlap RTTs
+    workers = int(os.environ.get("DIG_PAR", 64))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(send_query, res, d): d for d in domains}
+        for count, future in enumerate(as_completed(futures), 1):
+            latency, success = future.result()
+            latencies.append(latency)
+            success_flags.append(1 if success else 0)
+            progress_bar("Querying", count, total)
 
-    metrics = compute_metrics(results)
+    metrics = compute_metrics(latencies, success_flags)
     print("\n--- Metrics Summary ---")
     for k, v in metrics.items():
         print("%s: %s" % (k, v))
@@ -1,13 +1,34 @@
 #!/usr/bin/env python3
+import asyncio
 import sys
+import json
+import os
+import random
+import signal
 import socket
+import sqlite3
+import struct
 import time
+from collections import OrderedDict
 from datetime import datetime
-from scapy.all import IP, UDP, DNS, DNSQR, DNSRR, sr1
+import dns.exception
+import dns.message
+import dns.rcode
+import dns.rdatatype
 
 ROOT_SERVER_IP = "198.41.0.4"  # A.ROOT-SERVERS.NET
-CACHE_TTL_SECONDS = 3600  # 1 hour TTL
+CACHE_TTL_SECONDS = 3600  # 1 hour TTL, used when an answer carries no TTL
+CACHE_MAX_ENTRIES = 10000
+NEGATIVE_TTL_SECONDS = 60  # failed lookups are retried after 1 minute
+RESOLVE_TIMEOUT_SECONDS = 5  # per client query, across all hops
+MAX_PARALLEL_NS = 3  # glue addresses raced per delegation hop
+SOCKET_BUFFER_BYTES = 4 * 1024 * 1024  # kernel queue for bursts of client queries
+UPSTREAM_SOCKETS = 64  # upstream source ports; each query picks one at random
+_rng = random.SystemRandom()  # TID and port choice must not be predictable from earlier queries
 LOG_FILE = "resolver.log"
+CACHE_DB_FILE = "resolver_cache.db"
+CACHE_PURGE_INTERVAL_SECONDS = 60
+QTYPE_A = 1
 
 # --- Logging and Caching Classes ---
 
@@ -18,24 +39,32 @@ class DnsLog:
         self.unique_domains_resolved_count = 0
         self.max_domains_for_plot = 10
         self.log_filename = log_file
-        with open(self.log_filename, 'w', encoding='utf-8') as f:
-            f.write("DNS Resolver Log Started: %s\n" % datetime.now().isoformat())
+        # Keep one buffered handle open instead of reopening the file for every step
+        self.fh = open(self.log_filename, 'w', encoding='utf-8', buffering=1 << 16)
+        self.fh.write("DNS Resolver Log Started: %s\n" % datetime.now().isoformat())
 
-    def log_step(self, timestamp, domain, mode, server_ip, step, response_referral, rtt, total_time, cache_status="N/A"):
+    def log_step(self, ts_ns, domain, mode, server_ip, step, response_referral, rtt_ns, total_ns, cache_status="N/A"):
+        """ts_ns is wall-clock time.time_ns(); rtt_ns/total_ns are perf_counter_ns() deltas."""
         entry = {
-            'timestamp': timestamp.isoformat(),
+            'timestamp': datetime.fromtimestamp(ts_ns / 1e9).isoformat(),
             'domain_name': domain,
             'resolution_mode': mode,
             'dns_server_ip': server_ip,
             'step_of_resolution': step,
             'response_or_referral': response_referral,
-            'round_trip_time': "%.4fs" % rtt,
-            'total_time_to_resolution': "%.4fs" % total_time if total_time is not None else "N/A",
+            'round_trip_time': "%.4fs" % (rtt_ns / 1e9),
+            'total_time_to_resolution': "%.4fs" % (total_ns / 1e9) if total_ns is not None else "N/A",
             'cache_status': cache_status
         }
         self.log_entries.append(entry)
-        with open(self.log_filename, 'a', encoding='utf-8') as f:
-            f.write("%s\n" % str(entry))
+        self.fh.write(json.dumps(entry) + "\n")
+
+    def flush(self):
+        self.fh.flush()
+
+    def close(self):
+        self.fh.flush()
+        self.fh.close()
 
     def record_plot_data(self, domain, total_servers, total_latency):
         if domain not in self.plot_data and self.unique_domains_resolved_count < self.max_domains_for_plot:
@@ -56,23 +85,142 @@ class DnsLog:
 
 
 class DnsCache:
-    def __init__(self):
-        self.cache = {}
+    """In-memory LRU in front of an SQLite table, so answers survive resolver restarts."""
+
+    def __init__(self, db_file=CACHE_DB_FILE, max_entries=CACHE_MAX_ENTRIES, cold=False):
+        """cold discards answers persisted by earlier runs, so every lookup starts with a full walk."""
+        self.max_entries = max_entries
+        self.cache = OrderedDict()      # domain -> (ip, expiry), oldest first
+        self.neg_cache = OrderedDict()  # domain -> expiry of a cached failure
+        self.db = sqlite3.connect(db_file, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS cache "
+                        "(name TEXT, qtype INTEGER, ip TEXT, expires_at REAL, PRIMARY KEY (name, qtype))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS cache_expiry ON cache (expires_at)")
+        if cold:
+            self.db.execute("DELETE FROM cache")
+
+    def _remember(self, domain, entry):
+        self.cache[domain] = entry
+        self.cache.move_to_end(domain)
+        if len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
 
     def get(self, domain):
-        if domain in self.cache:
-            ip, cached_time = self.cache[domain]
-            if (time.time() - cached_time) < CACHE_TTL_SECONDS:
+        entry = self.cache.get(domain)
+        if entry is None:
+            entry = self.db.execute("SELECT ip, expires_at FROM cache WHERE name = ? AND qtype = ?",
+                                    (domain, QTYPE_A)).fetchone()
+        if entry is not None:
+            ip, expires_at = entry
+            if time.time() < expires_at:
+                self._remember(domain, (ip, expires_at))
                 return ip, "HIT"
             else:
-                del self.cache[domain]
+                self.cache.pop(domain, None)
         return None, "MISS"
 
-    def set(self, domain, ip):
-        self.cache[domain] = (ip, time.time())
+    def set(self, domain, ip, ttl=None):
+        if ttl is None:
+            ttl = CACHE_TTL_SECONDS
+        entry = (ip, time.time() + ttl)
+        self._remember(domain, entry)
+        self.neg_cache.pop(domain, None)
+        self.db.execute("INSERT OR REPLACE INTO cache (name, qtype, ip, expires_at) VALUES (?, ?, ?, ?)",
+                        (domain, QTYPE_A) + entry)
+
+    def purge_expired(self):
+        self.db.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+
+    def close(self):
+        self.db.close()
+
+    def remaining_ttl(self, domain):
+        entry = self.cache.get(domain)
+        if entry is None:
+            return 0
+        return max(0, int(entry[1] - time.time()))
+
+    def is_negative(self, domain):
+        expires_at = self.neg_cache.get(domain)
+        if expires_at is None:
+            return False
+        if time.time() < expires_at:
+            return True
+        del self.neg_cache[domain]
+        return False
+
+    def set_negative(self, domain):
+        self.neg_cache[domain] = time.time() + NEGATIVE_TTL_SECONDS
+        self.neg_cache.move_to_end(domain)
+        if len(self.neg_cache) > self.max_entries:
+            self.neg_cache.popitem(last=False)
+
+
+class _UpstreamSocket(asyncio.DatagramProtocol):
+    """Hands replies to the owning UpstreamClient, tagged with which pool socket got them."""
+
+    def __init__(self, client, index):
+        self.client = client
+        self.index = index
+
+    def datagram_received(self, data, addr):
+        self.client.reply_received(self.index, data, addr)
+
+
+class UpstreamClient:
+    """A fixed pool of UDP sockets, each bound to its own ephemeral port, for all upstream queries.
+
+    A query goes out on a randomly chosen socket and only a reply arriving on that socket is
+    matched, on (socket, transaction ID, server). A spoofer must therefore guess the source port
+    among UPSTREAM_SOCKETS as well as the 16-bit TID. That is fewer bits than a fresh port per
+    query gives, which is the cost of not opening a socket for every hop.
+    """
+
+    def __init__(self, size=UPSTREAM_SOCKETS):
+        self.size = size
+        self.transports = []
+        self.pending = {}  # (socket index, tid, server_ip) -> Future receiving the raw reply
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        for index in range(self.size):
+            transport, _ = await loop.create_datagram_endpoint(lambda index=index: _UpstreamSocket(self, index),
+                                                               local_addr=("0.0.0.0", 0))
+            self.transports.append(transport)
+
+    def close(self):
+        for transport in self.transports:
+            transport.close()
+        self.transports = []
+
+    def reply_received(self, index, data, addr):
+        if len(data) < DNS_HEADER.size:
+            return
+        tid = struct.unpack_from(">H", data)[0]
+        future = self.pending.pop((index, tid, addr[0]), None)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    async def query(self, domain, server_ip, timeout):
+        index = _rng.randrange(self.size)
+        tid = _rng.getrandbits(16)
+        while (index, tid, server_ip) in self.pending:
+            tid = _rng.getrandbits(16)
+        key = (index, tid, server_ip)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        try:
+            self.transports[index].sendto(build_a_query(tid, domain), (server_ip, 53))
+            data = await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(key, None)
+        return dns.message.from_wire(data)
 
 dns_log = DnsLog(LOG_FILE)
-dns_cache = DnsCache()
+dns_cache = None  # opened by start_dns_server, so importing this module creates no db files
+upstream = UpstreamClient()
 
 
 # --- Resolution Logic ---
@@ -85,7 +233,30 @@ def get_step_type(current_ip):
     return "Unknown"
 
 
-def resolve_iteratively(domain, original_domain=None, depth=0, max_depth=10):
+async def query_fastest(domain, server_ips, timeout=2):
+    """Send an A query to every server at once; return (response, server_ip) of the first valid reply.
+
+    Only NOERROR/NXDOMAIN count: a lame server's fast REFUSED or SERVFAIL loses like a timeout.
+    """
+    async def query_one(ip):
+        return await upstream.query(domain, ip, timeout), ip
+
+    tasks = [asyncio.ensure_future(query_one(ip)) for ip in server_ips]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                resp, ip = await next_done
+            except (asyncio.TimeoutError, dns.exception.DNSException, OSError):
+                continue
+            if resp.rcode() in (dns.rcode.NOERROR, dns.rcode.NXDOMAIN):
+                return resp, ip
+        return None, server_ips[0]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def resolve_iteratively(domain, original_domain=None, depth=0, max_depth=10):
     if depth > max_depth:
         print("[x] Maximum recursion depth reached for %s" % domain)
         return None
@@ -93,151 +264,247 @@ def resolve_iteratively(domain, original_domain=None, depth=0, max_depth=10):
     if original_domain is None:
         original_domain = domain
 
-    total_start_time = time.time()
+    total_start_ns = time.perf_counter_ns()
     ip_from_cache, cache_status = dns_cache.get(domain)
     if ip_from_cache:
-        total_latency = time.time() - total_start_time
-        timestamp = datetime.now()
-        dns_log.log_step(timestamp, domain, "Iterative (Cached)", "N/A", "Cache", "Answer: %s" % ip_from_cache, 0.0, total_latency, cache_status)
-        dns_log.record_plot_data(domain, 1, total_latency)
+        total_ns = time.perf_counter_ns() - total_start_ns
+        dns_log.log_step(time.time_ns(), domain, "Iterative (Cached)", "N/A", "Cache", "Answer: %s" % ip_from_cache, 0, total_ns, cache_status)
+        dns_log.record_plot_data(domain, 1, total_ns / 1e9)
         print("[*] Cache HIT for %s: %s" % (domain, ip_from_cache))
-        return IP(dst="127.0.0.1") / UDP(dport=53) / DNS(an=DNSRR(rrname=domain, type=1, rdata=ip_from_cache))
+        return ip_from_cache
+
+    if dns_cache.is_negative(domain):
+        dns_log.log_step(time.time_ns(), domain, "Iterative (Cached Failure)", "N/A", "Cache", "Recent resolution failed", 0, None, "NEGATIVE HIT")
+        print("[*] Negative cache HIT for %s" % domain)
+        return None
 
     current_ns_ip = ROOT_SERVER_IP
+    candidate_ips = [ROOT_SERVER_IP]
     servers_visited = 0
     print("\n[+] Starting iterative resolution for %s (Cache MISS)" % domain)
 
     for hop in range(max_depth):
-        step_start_time = time.time()
-        query = IP(dst=current_ns_ip) / UDP(dport=53) / DNS(rd=0, qd=DNSQR(qname=domain))
-        resp = sr1(query, verbose=0, timeout=2)
-        rtt = time.time() - step_start_time
-        timestamp = datetime.now()
+        step_start_ns = time.perf_counter_ns()
+        resp, current_ns_ip = await query_fastest(domain, candidate_ips)
+        rtt_ns = time.perf_counter_ns() - step_start_ns
+        timestamp = time.time_ns()
         servers_visited += 1
         step_type = get_step_type(current_ns_ip)
         response_referral = "Timeout or invalid response"
-        next_ip = current_ns_ip
+        next_ips = [current_ns_ip]
 
-        if not resp or not resp.haslayer(DNS):
-            dns_log.log_step(timestamp, domain, "Iterative (Query Failed)", current_ns_ip, step_type, response_referral, rtt, None, "MISS")
-            print("[x] Timeout or invalid response from %s" % current_ns_ip)
+        if resp is None:
+            dns_log.log_step(timestamp, domain, "Iterative (Query Failed)", current_ns_ip, step_type, response_referral, rtt_ns, None, "MISS")
+            print("[x] Timeout or invalid response from %s" % ', '.join(candidate_ips))
+            dns_cache.set_negative(domain)
             return None
 
-        dns_resp = resp[DNS]
-
         # Check Answer
-        if dns_resp.an:
-            answers = [rr.rdata for rr in dns_resp.an if rr.type == 1]
+        if resp.answer:
+            a_rrsets = [rrset for rrset in resp.answer if rrset.rdtype == dns.rdatatype.A]
+            answers = [rd.address for rrset in a_rrsets for rd in rrset]
             if answers:
                 final_ip = answers[0]
-                total_latency = time.time() - total_start_time
+                total_ns = time.perf_counter_ns() - total_start_ns
                 response_referral = "Answer: %s" % final_ip
-                dns_log.log_step(timestamp, domain, "Iterative (Resolved)", current_ns_ip, "Authoritative", response_referral, rtt, total_latency, "MISS")
-                dns_cache.set(domain, final_ip)
-                dns_log.record_plot_data(domain, servers_visited, total_latency)
+                dns_log.log_step(timestamp, domain, "Iterative (Resolved)", current_ns_ip, "Authoritative", response_referral, rtt_ns, total_ns, "MISS")
+                dns_cache.set(domain, final_ip, a_rrsets[0].ttl)
+                dns_log.record_plot_data(domain, servers_visited, total_ns / 1e9)
                 print("[*] Final Answer(s) for %s: %s" % (domain, answers))
-                return dns_resp
+                return final_ip
 
         # Check Authority (NS)
-        ns_names = []
-        if dns_resp.ns:
-            for rr in dns_resp.ns:
-                try:
-                    if rr.type == 2:
-                        ns_names.append(rr.rdata.decode())
-                except Exception:
-                    continue
+        ns_names = [rd.target.to_text() for rrset in resp.authority if rrset.rdtype == dns.rdatatype.NS for rd in rrset]
 
         if ns_names:
-            glue_ip = None
-            if dns_resp.ar:
-                for rr in dns_resp.ar:
-                    if rr.type == 1:
-                        glue_ip = rr.rdata
-                        break
-
-            if glue_ip:
-                next_ip = glue_ip
-                response_referral = "Delegation to: %s @ Glue IP: %s" % (', '.join(ns_names), glue_ip)
-                print("[>] Delegated to %s @ Glue IP: %s" % (ns_names[0], glue_ip))
+            glue_ips = [rd.address for rrset in resp.additional if rrset.rdtype == dns.rdatatype.A for rd in rrset]
+            glue_ips = glue_ips[:MAX_PARALLEL_NS]
+
+            if glue_ips:
+                next_ips = glue_ips
+                response_referral = "Delegation to: %s @ Glue IP: %s" % (', '.join(ns_names), ', '.join(glue_ips))
+                print("[>] Delegated to %s @ Glue IP: %s" % (ns_names[0], ', '.join(glue_ips)))
             else:
                 fallback_ns = ns_names[0]
                 # Prevent infinite recursion on original domain
                 if fallback_ns == original_domain:
                     print("[x] Cannot resolve NS %s for original domain %s (no glue IP)" % (fallback_ns, original_domain))
                     dns_log.log_step(timestamp, domain, "Iterative (Failed delegation)", current_ns_ip, step_type,
-                                     "No glue IP and NS same as original domain", rtt, None, "MISS")
+                                     "No glue IP and NS same as original domain", rtt_ns, None, "MISS")
+                    dns_cache.set_negative(domain)
                     return None
                 # Resolve NS to get its IP
-                temp_ns_resp = resolve_iteratively(fallback_ns, original_domain=original_domain, depth=depth+1)
-                if temp_ns_resp and temp_ns_resp.an and temp_ns_resp.an[0].type == 1:
-                    next_ip = temp_ns_resp.an[0].rdata
-                    print("[>] Found NS IP: %s" % next_ip)
+                ns_ip = await resolve_iteratively(fallback_ns, original_domain=original_domain, depth=depth+1)
+                if ns_ip:
+                    next_ips = [ns_ip]
+                    print("[>] Found NS IP: %s" % ns_ip)
                 else:
                     response_referral = "Failed to resolve next NS IP: %s" % fallback_ns
-                    dns_log.log_step(timestamp, domain, "Iterative (Failed delegation)", current_ns_ip, step_type, response_referral, rtt, None, "MISS")
+                    dns_log.log_step(timestamp, domain, "Iterative (Failed delegation)", current_ns_ip, step_type, response_referral, rtt_ns, None, "MISS")
                     print("[x] Failed to resolve next NS IP")
+                    dns_cache.set_negative(domain)
                     return None
 
-            dns_log.log_step(timestamp, domain, "Iterative (Delegation)", current_ns_ip, step_type, response_referral, rtt, None, "MISS")
-            current_ns_ip = next_ip
+            dns_log.log_step(timestamp, domain, "Iterative (Delegation)", current_ns_ip, step_type, response_referral, rtt_ns, None, "MISS")
+            candidate_ips = next_ips
             continue
         else:
             response_referral = "No authority section for delegation"
-            dns_log.log_step(timestamp, domain, "Iterative (Failed delegation)", current_ns_ip, step_type, response_referral, rtt, None, "MISS")
+            dns_log.log_step(timestamp, domain, "Iterative (Failed delegation)", current_ns_ip, step_type, response_referral, rtt_ns, None, "MISS")
             print("[x] No authority section to continue delegation")
+            dns_cache.set_negative(domain)
             return None
 
     # Max hops reached
-    total_latency = time.time() - total_start_time
-    dns_log.log_step(datetime.now(), domain, "Iterative (Failed)", current_ns_ip, get_step_type(current_ns_ip),
-                     "Iteration limit reached", 0.0, total_latency, "MISS")
+    total_ns = time.perf_counter_ns() - total_start_ns
+    dns_log.log_step(time.time_ns(), domain, "Iterative (Failed)", current_ns_ip, get_step_type(current_ns_ip),
+                     "Iteration limit reached", 0, total_ns, "MISS")
     print("[x] Iteration limit reached for %s" % domain)
+    dns_cache.set_negative(domain)
     return None
 
 
+# --- Wire Format Helpers ---
+
+DNS_HEADER = struct.Struct(">HHHHHH")
+A_RECORD = struct.Struct(">HHHIH")  # name pointer, type, class, ttl, rdlength
+FLAG_RD = 0x0100
+A_QUESTION_SUFFIX = b"\x00\x00\x01\x00\x01"  # root label, QTYPE=A, QCLASS=IN
+
+
+def build_a_query(tid, qname):
+    """Iterative (RD=0) single-question A query for qname.
+
+    Labels are encoded before their length is taken, so the length byte counts bytes, not characters;
+    surrogateescape gives back exactly the bytes parse_question read from the client.
+    """
+    raw_labels = (label.encode('utf-8', errors='surrogateescape') for label in qname.rstrip('.').split('.'))
+    labels = b"".join(bytes([len(raw)]) + raw for raw in raw_labels if raw)
+    return DNS_HEADER.pack(tid, 0, 1, 0, 0, 0) + labels + A_QUESTION_SUFFIX
+
+
+def parse_question(data):
+    """Return (tid, flags, question_bytes, domain) for the first question, or None if malformed."""
+    try:
+        tid, flags, qdcount, _, _, _ = DNS_HEADER.unpack_from(data)
+        if qdcount == 0:
+            return None
+        labels = []
+        off = DNS_HEADER.size
+        while data[off]:
+            length = data[off]
+            labels.append(data[off + 1:off + 1 + length])
+            off += length + 1
+        off += 5  # root label + QTYPE + QCLASS
+        if off > len(data):
+            return None
+    except (struct.error, IndexError):
+        return None
+    # Lossless: undecodable bytes survive as surrogates and build_a_query re-encodes them unchanged
+    domain = b".".join(labels).decode('utf-8', errors='surrogateescape')
+    return tid, flags, data[DNS_HEADER.size:off], domain
+
+
+def build_answer(tid, flags, question, ip, ttl):
+    """A single-answer authoritative reply; the answer name points back at the question."""
+    header = DNS_HEADER.pack(tid, 0x8400 | (flags & FLAG_RD), 1, 1, 0, 0)
+    return header + question + A_RECORD.pack(0xC00C, 1, 1, ttl, 4) + socket.inet_aton(ip)
+
+
+def build_servfail(tid, flags, question):
+    return DNS_HEADER.pack(tid, 0x8002 | (flags & FLAG_RD), 1, 0, 0, 0) + question
+
+
 # --- UDP DNS Server ---
 
-def start_dns_server(port):
+class ResolverProtocol(asyncio.DatagramProtocol):
+    """Answers each client query in its own task so slow walks don't block other clients."""
+
+    def __init__(self):
+        self.transport = None
+        self.tasks = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        task = asyncio.get_running_loop().create_task(self._handle(data, addr))
+        # The loop only keeps weak references to tasks
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _handle(self, data, addr):
+        parsed = parse_question(data)
+        if parsed is None:
+            return
+        tid, flags, question, domain = parsed
+        print("\n--- Incoming Query from %s: %s ---" % (addr, domain))
+        try:
+            answer_ip = await asyncio.wait_for(resolve_iteratively(domain), timeout=RESOLVE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            print("[x] Resolution timed out for %s" % domain)
+            answer_ip = None
+        if answer_ip:
+            reply = build_answer(tid, flags, question, answer_ip, dns_cache.remaining_ttl(domain))
+        else:
+            reply = build_servfail(tid, flags, question)
+        self.transport.sendto(reply, addr)
+        print("[<] Sent response to %s" % str(addr))
+        dns_log.flush()  # one write per client query; the steps stay on disk if the process is killed
+
+
+def make_server_socket(port):
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # Let bursts from many clients queue in the kernel instead of being dropped
+    # while the event loop is busy; Linux clamps these to net.core.[rw]mem_max.
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_BYTES)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_BYTES)
     sock.bind(("0.0.0.0", port))
-    print("[*] Custom DNS Resolver running on UDP port %d..." % port)
+    sock.setblocking(False)
+    return sock
+
 
+async def purge_cache_periodically():
+    while True:
+        await asyncio.sleep(CACHE_PURGE_INTERVAL_SECONDS)
+        dns_cache.purge_expired()
+
+
+async def serve(port):
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(ResolverProtocol, sock=make_server_socket(port))
+    await upstream.start()
+    print("[*] Custom DNS Resolver running on UDP port %d..." % port)
+    purger = loop.create_task(purge_cache_periodically())
+    stop = loop.create_future()
+    # Closing the h5 xterm (SIGHUP), pkill or net.stop() (SIGTERM) shut down like Ctrl-C
+    for sig in (signal.SIGTERM, signal.SIGHUP):
+        loop.add_signal_handler(sig, lambda: stop.done() or stop.set_result(None))
     try:
-        while True:
-            data, addr = sock.recvfrom(512)
-            dns_query = DNS(data)
-            if not dns_query or not dns_query.qd:
-                continue
-            domain = dns_query.qd.qname.decode(errors='ignore').rstrip('.')
-            print("\n--- Incoming Query from %s: %s ---" % (addr, domain))
-            dns_response = resolve_iteratively(domain)
-            if dns_response and dns_response.an:
-                answer_pkt = DNS(
-                    id=dns_query.id,
-                    qr=1, aa=1, ra=0,
-                    qd=dns_query.qd,
-                    an=dns_response.an
-                )
-            else:
-                answer_pkt = DNS(
-                    id=dns_query.id,
-                    qr=1, rcode=2,  # SERVFAIL
-                    qd=dns_query.qd
-                )
-            sock.sendto(bytes(answer_pkt), addr)
-            print("[<] Sent response to %s" % str(addr))
+        await stop  # run until signalled or cancelled
+    finally:
+        purger.cancel()
+        upstream.close()
+        transport.close()
 
+
+def start_dns_server(port, cold_cache=False):
+    global dns_cache
+    dns_cache = DnsCache(cold=cold_cache)
+    try:
+        asyncio.run(serve(port))  # returns on SIGTERM/SIGHUP
     except KeyboardInterrupt:
-        print("\n[!] Server shutting down.")
-        dns_log.print_plot_summary()
+        pass
     finally:
-        sock.close()
+        dns_log.close()
+        dns_cache.close()
+    print("\n[!] Server shutting down.")
+    dns_log.print_plot_summary()
 
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: sudo python3 %s <port>" % sys.argv[0])
+        print("Usage: sudo python3 %s <port> [--cold-cache]" % sys.argv[0])
         sys.exit(1)
     try:
         port = int(sys.argv[1])
@@ -245,4 +512,6 @@ if __name__ == "__main__":
         print("Error: Port must be an integer.")
         sys.exit(1)
 
-    start_dns_server(port)
+    # --cold-cache (or RESOLVER_COLD_CACHE=1): forget answers persisted in resolver_cache.db
+    cold_cache = "--cold-cache" in sys.argv[2:] or os.environ.get("RESOLVER_COLD_CACHE") == "1"
+    start_dns_server(port, cold_cache)
@@ -4,22 +4,40 @@ import shlex
 import re
 # Removed: from collections import OrderedDict # Not used
 import sys
+from functools import lru_cache
+from multiprocessing import Pool
+
+try:
+    import re2  # optional (pip install google-re2): linear-time DFA matching
+except ImportError:
+    re2 = None
 
 # --- Domain Validation Logic (Provided by user, included for completeness) ---
 
-# domain validation: requires at least one dot and plausible labels / TLD
-DOMAIN_RE = re.compile(
-    r'^(?=.{1,253}$)'                             # whole length limit
-    r'(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+'  # labels and dots
+# domain validation: requires at least one dot and plausible labels / TLD.
+# The whole-length limit is checked with len() instead of a lookahead, which RE2 cannot compile.
+DOMAIN_MAX_LEN = 253
+DOMAIN_PATTERN = (
+    r'^(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+'  # labels and dots
     r'[A-Za-z]{2,63}$'                           # TLD (letters only)
 )
+if re2 is not None:
+    DOMAIN_RE = re2.compile(DOMAIN_PATTERN)
+else:
+    # labels are ASCII, skip Unicode classes
+    DOMAIN_RE = re.compile(DOMAIN_PATTERN, re.ASCII)
 
+# The same names repeat heavily within a capture, so remember recent answers
+@lru_cache(maxsize=65536)
 def is_valid_domain(d):
     """Return True if d looks like a valid domain name (simple but robust)."""
-    return bool(DOMAIN_RE.match(d))
+    return 0 < len(d) <= DOMAIN_MAX_LEN and bool(DOMAIN_RE.match(d))
 
 # --- Packet Filtering Function (New Core Logic) ---
 
+FILTER_EXPRESSION = "dns.flags.response == 0 && dns.qry.name && dns.qry.type == 1"
+COMBINED_OUTPUT_FILE = "combined_dns.pcap"
+
 def filter_dns_packets(input_pcap_file, output_pcap_file):
     """
     Filters an input PCAP file to extract only A-type DNS query packets
@@ -36,12 +54,17 @@ def filter_dns_packets(input_pcap_file, output_pcap_file):
         return False
 
     # 2. Build the tshark command
+    # -n: Disable name resolution (no reverse lookups for every address)
+    # -q: Don't print per-packet summaries we never read
+    # -F: Write classic pcap rather than pcapng
     # -r: Read input file
     # -Y: Apply the display filter
     # -w: Write the captured packets matching the filter to the output file
-    filter_expression = "dns.flags.response == 0 && dns.qry.name && dns.qry.type == 1"
+    filter_expression = FILTER_EXPRESSION
     cmd = [
         "tshark",
+        "-n", "-q",
+        "-F", "pcap",
         "-r", input_pcap_file,          # Pass raw file name
         "-Y", filter_expression,
         "-w", output_pcap_file          # Pass raw file name
@@ -73,23 +96,90 @@ def filter_dns_packets(input_pcap_file, output_pcap_file):
         print("   [FATAL] 'tshark' command not found. Please ensure Wireshark/Tshark is installed and accessible in your system's PATH.")
         sys.exit(1)
 
+def filter_dns_packets_combined(input_pcap_files, output_pcap_file):
+    """
+    Merges all input PCAP files with mergecap and filters the merged stream
+    in a single tshark run, so tshark's startup and dissector loading are
+    paid once instead of once per file. The result is one combined output
+    file; use filter_dns_packets() when per-host outputs are needed.
+    """
+    print("-> Processing {0} as one merged capture...".format(", ".join(input_pcap_files)))
+
+    missing = [f for f in input_pcap_files if not os.path.exists(f)]
+    if missing:
+        print("   [Error] Input PCAP not found: {0}".format(", ".join(missing)))
+        return False
+
+    merge_cmd = ["mergecap", "-w", "-"] + list(input_pcap_files)
+    tshark_cmd = [
+        "tshark",
+        "-n", "-q",
+        "-F", "pcap",
+        "-r", "-",                      # Read the merged capture from stdin
+        "-Y", FILTER_EXPRESSION,
+        "-w", output_pcap_file
+    ]
+
+    merge = None
+    try:
+        merge = subprocess.Popen(merge_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        tshark = subprocess.Popen(tshark_cmd, stdin=merge.stdout, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE, universal_newlines=True)
+    except FileNotFoundError as e:
+        if merge is not None:
+            merge.kill()
+            merge.wait()
+        print("   [FATAL] '{0}' command not found. Please ensure Wireshark/Tshark is installed and accessible in your system's PATH.".format(e.filename))
+        sys.exit(1)
+
+    # Drop our copy of the pipe so mergecap gets SIGPIPE if tshark exits early
+    merge.stdout.close()
+    _, tshark_err = tshark.communicate()
+    merge_err = merge.stderr.read().decode("utf-8", errors="replace")
+    merge.wait()
+
+    if merge.returncode != 0 or tshark.returncode != 0:
+        print("   [Error] mergecap | tshark pipeline failed.")
+        print("     Command: {0} | {1}".format(" ".join(merge_cmd), " ".join(tshark_cmd)))
+        print("     Output: {0}".format((merge_err + tshark_err).strip() or "No error output available."))
+        return False
+
+    print("   [Success] Filtered packets saved to {0}.".format(output_pcap_file))
+    return True
+
+def _filter_one(input_file):
+    """Pool worker: filters one PCAP into its <name>_dns<ext> counterpart."""
+    # Dynamically create the output file name (e.g., h1.pcap -> h1_dns.pcap)
+    base_name, ext = os.path.splitext(input_file)
+    output_file = "{0}_dns{1}".format(base_name, ext)
+    try:
+        return filter_dns_packets(input_file, output_file)
+    except SystemExit:
+        # A worker must not exit on its own; report the fatal error to main() instead
+        return None
+
 # --- Main Execution Block ---
 
-def main():
+def main(combined=False):
     """Defines the input files and executes the filtering process."""
     
     # Define the input PCAP files as requested (h1.pcap, h2.pcap, h3.pcap, h4.pcap)
     input_files = ["h1.pcap", "h2.pcap", "h3.pcap", "h4.pcap"]
     
     print("--- Starting PCAP DNS Filtering Process ---")
+
+    if combined:
+        # One merged output instead of h1_dns.pcap..h4_dns.pcap
+        if not filter_dns_packets_combined(input_files, COMBINED_OUTPUT_FILE):
+            sys.exit(1)
+        print("--- Filtering Complete ---")
+        return
     
-    for input_file in input_files:
-        # Dynamically create the output file name (e.g., h1.pcap -> h1_dns.pcap)
-        base_name, ext = os.path.splitext(input_file)
-        output_file = "{0}_dns{1}".format(base_name, ext)
-        
-        # Run the filtering process
-        filter_dns_packets(input_file, output_file)
+    # Each tshark run reads a different file, so they can all run at once
+    with Pool(processes=min(len(input_files), os.cpu_count() or 1)) as pool:
+        results = pool.map(_filter_one, input_files)
+    if None in results:
+        sys.exit(1)
         
     print("--- Filtering Complete ---")
 
@@ -116,4 +206,5 @@ if __name__ == "__main__":
             except OSError as e:
                 print("Could not create dummy file {0}: {1}".format(f, e))
                 
-    main()
\ No newline at end of file
+    # --combined: write a single combined_dns.pcap via one mergecap | tshark pipeline
+    main(combined="--combined" in sys.argv[1:])
\ No newline at end of file
@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
+import io
 import os
-import time
-import sys
 import subprocess
-import statistics
+import hashlib
+import tempfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from bulk_query import BATCH_END
 from mininet.net import Mininet
 from mininet.node import OVSController
 from mininet.link import TCLink
@@ -13,110 +16,259 @@ from mininet.nodelib import NAT
 
 EXTERNAL_DNS_IP = '8.8.8.8'
 NAT_IP = '10.0.0.254'
+QUERY_CONCURRENCY = int(os.environ.get("QUERY_PAR", 64))  # queries in flight per host
+DNS_QUERY_FILTER = 'dns.flags.response == 0 && dns.qry.name'
+DNS_QUERY_CACHE_DIR = '.dnsq_cache'  # query-only copies of the captures, in a directory beside each capture
+_TSHARK_ARGV = ('tshark', '-n')  # no name resolution while dissecting
+_TSHARK_FIELDS_ARGV = ('-T', 'fields', '-e', 'dns.qry.name')
+
+# Run inside each Mininet host, straight from the checkout; hosts share the root filesystem
+BULK_QUERY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bulk_query.py')
+_query_procs = {}  # (host name, resolver ip, port) -> running bulk query process
+
+def query_process(host, resolver_ip, port=53):
+    """Returns host's bulk query process for resolver_ip:port, starting it on first use."""
+    key = (host.name, resolver_ip, port)
+    proc = _query_procs.get(key)
+    if proc is None or proc.poll() is not None:
+        proc = host.popen(['python3', BULK_QUERY_SCRIPT, resolver_ip, str(QUERY_CONCURRENCY), str(port)],
+                          stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _query_procs[key] = proc
+    return proc
+
+def close_query_processes():
+    for proc in _query_procs.values():
+        proc.stdin.close()  # EOF between batches makes the script exit
+        proc.wait()
+    _query_procs.clear()
+
+PROGRESS_STEPS = 20
+PROGRESS_BARS = [b"#" * i + b"-" * (PROGRESS_STEPS - i) for i in range(PROGRESS_STEPS + 1)]
+_progress_filled = {}  # label -> last drawn fill, so each host's bar only redraws when it grows
 
 def progress_bar(label, n, total):
-    steps = 20
-    percent = int((n / total) * 100) if total else 0
-    filled = int(steps * n / total) if total else 0
-    bar = "#" * filled + "-" * (steps - filled)
-    sys.stdout.write("\r%s [%s] %d%%" % (label, bar, percent))
-    sys.stdout.flush()
+    filled = PROGRESS_STEPS * n // total if total else 0
+    if n < total and _progress_filled.get(label) == filled:
+        return
+    _progress_filled[label] = filled
+    percent = 100 * n // total if total else 0
+    buf = b"\r%s [%s] %d%%" % (label.encode(), PROGRESS_BARS[filled], percent)
     if n >= total:
-        sys.stdout.write("\n")
+        buf += b"\n"
+    os.write(1, buf)  # one unbuffered write, nothing left to flush
 
-def run_queries(host, resolver_ip, pcap_file):
-    results = []
-    domains = []
-    
-    info("\nExtracting unique domains from {} using TShark...".format(pcap_file))
-    
+def _probe_tshark():
+    """Returns None if tshark runs, otherwise the error message to report."""
     try:
-        subprocess.run(['tshark', '-v'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, timeout=5)
+        subprocess.run(['tshark', '-v'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, timeout=5)
     except FileNotFoundError:
-        info("\nERROR: TShark command not found. Please install TShark (Wireshark command-line utility) to proceed.\n")
-        return results
+        return "\nERROR: TShark command not found. Please install TShark (Wireshark command-line utility) to proceed.\n"
     except subprocess.CalledProcessError:
-        info("\nERROR: TShark installed but failed to run. Check your installation.\n")
-        return results
+        return "\nERROR: TShark installed but failed to run. Check your installation.\n"
     except subprocess.TimeoutExpired:
-        info("\nERROR: TShark check timed out.\n")
-        return results
+        return "\nERROR: TShark check timed out.\n"
+    return None
+
+_TSHARK_ERROR = _probe_tshark()  # probed once here rather than in every run_queries call
+
+def count_packets(pcap_file):
+    """Packet count via capinfos, or None when capinfos is unavailable or cannot read the file."""
+    try:
+        out = subprocess.run(['capinfos', '-M', '-T', '-r', '-c', pcap_file],
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, timeout=30).stdout
+        return int(out.split(b'\t')[-1])
+    except (FileNotFoundError, subprocess.SubprocessError, ValueError):
+        return None
+
+def filter_dns_queries(pcap_file):
+    """Returns a pcap with only pcap_file's DNS queries, reusing a cached copy made from the same file,
+    or None if pcap_file holds no DNS queries at all.
+
+    The copy is named after the capture's absolute path, then its size and mtime and the filter, so a
+    different capture swapped in under the same name (even with an older mtime) gets its own copy
+    and the copies it replaces are removed.
+    """
+    source = os.stat(pcap_file)  # FileNotFoundError here means the capture itself is missing
+    source_path = os.path.abspath(pcap_file)
+    cache_dir = os.path.join(os.path.dirname(source_path), DNS_QUERY_CACHE_DIR)
+    prefix = hashlib.sha1(source_path.encode('utf-8')).hexdigest() + '-'
+    version = "%d\0%d\0%s" % (source.st_size, source.st_mtime_ns, DNS_QUERY_FILTER)
+    filtered_name = prefix + hashlib.sha1(version.encode('utf-8')).hexdigest() + '.pcap'
+    filtered_pcap = os.path.join(cache_dir, filtered_name)
+    if os.path.exists(filtered_pcap):
+        return filtered_pcap
+    # tshark stops at the first matching packet, so a capture without DNS is not dissected to the end
+    probe_cmd = _TSHARK_ARGV + ('-r', pcap_file, '-Y', DNS_QUERY_FILTER, '-c', '1', '-T', 'fields', '-e', 'frame.number')
+    probe = subprocess.run(probe_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    if not probe.stdout.strip():
+        return None
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    # Unique partial name, renamed only once tshark succeeds, so a failed or concurrent run is never reused
+    fd, partial = tempfile.mkstemp(dir=cache_dir, suffix='.part')
+    os.close(fd)
+    try:
+        subprocess.run(_TSHARK_ARGV + ('-r', pcap_file, '-Y', DNS_QUERY_FILTER, '-w', partial),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+        os.replace(partial, filtered_pcap)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    # Older copies of this same path can never match again
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name.endswith('.pcap') and name != filtered_name:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                pass  # another run already pruned it
+    return filtered_pcap
+
+def extract_domains(host_name, pcap_file):
+    """Unique query names in pcap_file, in first-seen order; [] if the capture can't be read."""
+    domains = []
+    
+    info("\nExtracting unique domains from {} using TShark...".format(pcap_file))
+    
+    if _TSHARK_ERROR:
+        info(_TSHARK_ERROR)
+        return []
     
     try:
-        tshark_cmd = [
-            'tshark', 
-            '-r', pcap_file,
-            '-Y', 'dns.flags.response == 0 && dns.qry.name',
-            '-T', 'fields',
-            '-e', 'dns.qry.name'
-        ]
+        # capinfos only walks the record headers, so empty captures are skipped without a dissection pass
+        if count_packets(pcap_file) == 0:
+            info("\nWARNING: PCAP file '{}' has no packets. Skipping queries for {}.\n".format(pcap_file, host_name))
+            return []
+        filtered_pcap = filter_dns_queries(pcap_file)
+        if filtered_pcap is None:
+            info("\nWARNING: PCAP file '{}' has no DNS queries. Skipping queries for {}.\n".format(pcap_file, host_name))
+            return []
+        # Every packet left already matches the filter, so this pass only extracts fields
+        tshark_cmd = _TSHARK_ARGV + ('-r', filtered_pcap) + _TSHARK_FIELDS_ARGV
         
-        tshark_process = subprocess.run(tshark_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        # tshark's warnings go to a file: a full stderr pipe nobody reads until awk hits EOF would deadlock
+        tshark_stderr = tempfile.TemporaryFile()
+        tshark_process = subprocess.Popen(tshark_cmd, stdout=subprocess.PIPE, stderr=tshark_stderr)
+        # awk drops repeated names while tshark is still streaming, so only unique lines reach Python;
+        # keys are stored with no value (no per-name counter), which keeps awk's table small on big captures
+        awk_process = subprocess.Popen(['awk', '!($0 in seen) { seen[$0]; print }'],
+                                       stdin=tshark_process.stdout, stdout=subprocess.PIPE)
+        tshark_process.stdout.close()  # awk owns the read end now; lets tshark see SIGPIPE
         
-        tshark_output_stdout = tshark_process.stdout.decode('utf-8')
-        raw_domains = tshark_output_stdout.splitlines()
+        # awk matched raw lines; "example.com." and "example.com" only collide after cleaning
+        stripped = (line.strip() for line in io.TextIOWrapper(awk_process.stdout, encoding='utf-8'))
+        cleaned = (d[:-1] if d.endswith('.') else d for d in stripped)
+        domains = [d for d in dict.fromkeys(cleaned) if d]
+        awk_process.wait()
         
-        seen_domains = set()
-        for domain in raw_domains:
-            cleaned_domain = domain.strip().strip('.')
-            if cleaned_domain and cleaned_domain not in seen_domains:
-                domains.append(cleaned_domain)
-                seen_domains.add(cleaned_domain)
+        with tshark_stderr:
+            if tshark_process.wait() != 0:
+                tshark_stderr.seek(0)
+                raise subprocess.CalledProcessError(tshark_process.returncode, tshark_cmd, stderr=tshark_stderr.read())
         
     except FileNotFoundError: 
-        info("\nWARNING: PCAP file '{}' not found. Skipping queries for {}.\n".format(pcap_file, host.name))
-        return results
+        info("\nWARNING: PCAP file '{}' not found. Skipping queries for {}.\n".format(pcap_file, host_name))
+        return []
     except subprocess.CalledProcessError as e:
         error_message = e.stderr.decode('utf-8').strip() if e.stderr else "Unknown TShark error."
         info("\nERROR running TShark on PCAP file: {}\n".format(error_message))
-        return results
+        return []
     except Exception as e:
         info("\nGENERAL ERROR processing PCAP file: {}\n".format(e))
-        return results
+        return []
+
+    info("Found {} unique queries in {}.\n".format(len(domains), pcap_file))
+    return domains
+
+def split_by_first_host(host_domains):
+    """Gives each domain to the first host (in host_domains order) whose capture has it.
+
+    Returns host name -> the domains that host resolves itself; the rest of its domains are
+    answered from the shared cache. Ownership depends only on the captures, so the split is
+    the same on every run however the concurrent hosts are scheduled.
+    """
+    owner = {}
+    for name, domains in host_domains.items():
+        for domain in domains:
+            owner.setdefault(domain, name)
+    owned = {name: [] for name in host_domains}
+    for domain, name in owner.items():
+        owned[name].append(domain)
+    return owned
+
+def shared_result(domain, cache):
+    """Result for a domain another host resolved: a cache hit if that host got an answer."""
+    if domain in cache:
+        # No network time is spent, so it doesn't count as latency or bytes
+        return {"latency": 0.0, "success": 1, "bytes": 0, "cached": True}
+    return {"latency": 0.0, "success": 0, "bytes": 0}
+
+def query_from_host(host, resolver_ip, domains, cache=None, port=53):
+    """Resolves domains from inside host with one dnspython process instead of a dig per domain.
 
+    cache, if given, receives domain -> result for every domain answered successfully.
+    """
+    results = []
+    if not domains:
+        return results
     total = len(domains)
     count = 0
-    
-    info("Found {} unique queries in {}.\n".format(total, pcap_file))
 
-    for domain in domains:
-        start = time.time()
-        ret = host.cmd("dig +time=2 @%s %s +short" % (resolver_ip, domain))
-        end = time.time()
-        latency = end - start
-        
-        success = 1 if ret.strip() and not ("connection timed out" in ret.lower()) else 0
-        
-        results.append({"latency": latency, "success": success})
+    proc = query_process(host, resolver_ip, port)
+    # The script reads the whole batch before answering, so this cannot deadlock on stdout
+    proc.stdin.write(("\n".join(domains) + "\n\n").encode('utf-8'))
+    proc.stdin.flush()
+
+    for line in proc.stdout:
+        line = line.decode('utf-8').rstrip('\n')
+        if line == BATCH_END:
+            break
+        domain, latency, success, size, addrs = line.split('\t')
+        result = {"latency": float(latency), "success": int(success), "bytes": int(size)}
+        if cache is not None and result["success"]:
+            cache[domain] = result
+        results.append(result)
         count += 1
         progress_bar("Queries from %s" % host.name, count, total)
-            
+
+    else:
+        # stdout hit EOF before BATCH_END: the process died, so drop it and let the next batch restart it
+        _query_procs.pop((host.name, resolver_ip, port), None)
+        proc.wait()
+        info("\nERROR: query process on {} failed: {}\n".format(host.name, proc.stderr.read().decode('utf-8').strip()))
     return results
 
 def compute_metrics(results):
+    # Convert once to arrays; every aggregate below is then a vectorised reduction
     total_queries = len(results)
-    successful = sum(r["success"] for r in results)
+    lat = np.fromiter((r["latency"] for r in results), dtype=np.float64, count=total_queries)
+    succ = np.fromiter((r["success"] for r in results), dtype=np.int8, count=total_queries)
+    cached_mask = np.fromiter((r.get("cached", False) for r in results), dtype=bool, count=total_queries)
+    sizes = np.fromiter((r["bytes"] for r in results), dtype=np.int64, count=total_queries)
+    successful = int(succ.sum())
     failed = total_queries - successful
-    latencies = [r["latency"] for r in results if r["success"]]
-    avg_latency = statistics.mean(latencies) if latencies else 0
+    cached = int(cached_mask.sum())
+    # Cached answers took no network time, so they are left out of the latency statistics
+    measured = lat[(succ == 1) & ~cached_mask]
+    avg_latency = float(measured.mean()) if measured.size else 0
+    stddev_latency = float(measured.std()) if measured.size else 0
+    total_time = float(lat.sum())
     
-    total_bytes = successful * 100 
-    total_time = sum([r["latency"] for r in results])
+    # Sizes of the answers re-encoded by dnspython (to_wire), not bytes counted off the socket;
+    # cached answers add neither bytes nor time
+    total_bytes = int(sizes[succ == 1].sum())
     throughput = total_bytes / total_time if total_time > 0 else 0
 
     return {"total_queries": total_queries,
             "successful_queries": successful,
             "failed_queries": failed,
+            "cached_queries": cached,
             "avg_latency_s": round(avg_latency, 4),
+            "stddev_latency_s": round(stddev_latency, 4),
             "throughput_Bps": int(throughput)}
 
-def run_experiment():
-    net = None
-    metrics = {}
-    gateway_ip = NAT_IP
-
+def build_net(gateway_ip=NAT_IP):
+    """Builds and starts the topology; kept apart from run_experiment so a running net can be reused."""
+    net = Mininet(controller=OVSController, link=TCLink)
     try:
-        net = Mininet(controller=OVSController, link=TCLink)
         net.addController('c0', controller=OVSController)
 
         s1 = net.addSwitch('s1')
@@ -131,29 +283,35 @@ def run_experiment():
 
         hosts = {}
         info("--- Adding hosts with IP/Mask and default route via {} ---\n".format(gateway_ip))
-        
+    
         default_route = 'via %s' % gateway_ip
-        
-        hosts['h1'] = net.addHost('h1', ip='10.0.0.1/24', defaultRoute=default_route)
-        hosts['h2'] = net.addHost('h2', ip='10.0.0.2/24', defaultRoute=default_route)
-        hosts['h3'] = net.addHost('h3', ip='10.0.0.3/24', defaultRoute=default_route)
-        hosts['h4'] = net.addHost('h4', ip='10.0.0.4/24', defaultRoute=default_route)
-        hosts['h5'] = net.addHost('h5', ip='10.0.0.5/24', defaultRoute=default_route)
+    
+        for i in range(1, 6):
+            name = 'h%d' % i
+            hosts[name] = net.addHost(name, ip='10.0.0.%d/24' % i, defaultRoute=default_route)
 
         net.addLink(hosts['h1'], s1, bw=100, delay='2ms')
         net.addLink(hosts['h2'], s2, bw=100, delay='2ms')
         net.addLink(hosts['h5'], s2, bw=100, delay='1ms') 
         net.addLink(hosts['h3'], s3, bw=100, delay='2ms')
         net.addLink(hosts['h4'], s4, bw=100, delay='2ms')
-        
+    
         net.addLink(s1, s2, bw=100, delay='5ms')
         net.addLink(s2, s3, bw=100, delay='8ms')
         net.addLink(s3, s4, bw=100, delay='10ms')
 
         net.start()
-        
+    except BaseException:
+        net.stop()  # tear down switches and veths already created; __main__ never receives this net
+        raise
+    return net
+
+def run_experiment(net):
+    metrics = {}
+
+    try:
         dns_ip = EXTERNAL_DNS_IP
-        client_hosts = [hosts[h] for h in ['h1', 'h2', 'h3', 'h4']]
+        client_hosts = [net[h] for h in ['h1', 'h2', 'h3', 'h4']]
         
         info("\n--- Configuring clients (h1-h4) to use Google DNS {}...\n".format(dns_ip))
         for h in client_hosts:
@@ -161,9 +319,24 @@ def run_experiment():
 
         info("\n*** Starting DNS queries against Google DNS ({})...\n".format(dns_ip))
         
+        # Extract every capture before any host queries, so the shared cache is split deterministically;
+        # zip keeps host_domains in h1..h4 order whichever extraction finishes first
+        with ThreadPoolExecutor(max_workers=len(client_hosts)) as pool:
+            extracted = pool.map(lambda h: extract_domains(h.name, "%s_dns.pcap" % h.name), client_hosts)
+            host_domains = {h.name: domains for h, domains in zip(client_hosts, extracted)}
+        owned = split_by_first_host(host_domains)
+        resolver_cache = {}  # domain -> result, filled by the host that owns the domain
+        # One worker per host: each run only drives its own host's shell, so they can overlap.
+        # Hosts resolve disjoint domain sets, so none of them ever waits on or races another's answers.
+        with ThreadPoolExecutor(max_workers=len(client_hosts)) as pool:
+            futures = {h.name: pool.submit(query_from_host, h, dns_ip, owned[h.name], resolver_cache)
+                       for h in client_hosts}
+            host_results = {name: future.result() for name, future in futures.items()}
+
         for h in client_hosts:
-            pcap_file_name = "%s_dns.pcap" % h.name
-            results = run_queries(h, dns_ip, pcap_file_name)
+            owned_here = set(owned[h.name])
+            results = host_results[h.name] + [shared_result(d, resolver_cache)
+                                              for d in host_domains[h.name] if d not in owned_here]
             
             if results:
                 metrics[h.name] = compute_metrics(results)
@@ -176,10 +349,14 @@ def run_experiment():
 
     except Exception as e:
         info("An error occurred during experiment: {}\n".format(e))
-    finally:
-        if net:
-            net.stop()
 
 if __name__ == "__main__":
     setLogLevel('info')
-    run_experiment()
+    net = None
+    try:
+        net = build_net()
+        run_experiment(net)
+    finally:
+        close_query_processes()
+        if net:
+            net.stop()
@@ -1,7 +1,17 @@
 #!/usr/bin/env python3
+import ast
+import json
 import matplotlib.pyplot as plt
 
 LOG_FILE = "h1.log"
+NUM_DOMAINS = 10  # only the first N resolved domains are plotted
+
+def parse_entry(line):
+    # The resolver writes JSON lines; older logs (e.g. Results/h*.log) hold Python dict reprs
+    try:
+        return json.loads(line)
+    except ValueError:
+        return ast.literal_eval(line)
 
 # --- Parse the log ---
 domain_final_data = {}  # {domain: {'servers': count, 'latency': float}}
@@ -13,7 +23,7 @@ with open(LOG_FILE, "r", encoding="utf-8") as f:
         if not line:
             continue
         try:
-            entry = eval(line)
+            entry = parse_entry(line)
             domain = entry.get("domain_name")
             server_ip = entry.get("dns_server_ip")
             
@@ -34,11 +44,13 @@ with open(LOG_FILE, "r", encoding="utf-8") as f:
                 servers_visited = len(temp_servers[domain])
                 if domain not in domain_final_data:
                     domain_final_data[domain] = {'servers': servers_visited, 'latency': latency}
+                    if len(domain_final_data) >= NUM_DOMAINS:
+                        break  # the rest of the log would be discarded anyway
         except Exception:
             continue
 
-# Take first 10 unique domains
-first_domains = list(domain_final_data.keys())[:10]
+# Take first N unique domains
+first_domains = list(domain_final_data.keys())[:NUM_DOMAINS]
 if not first_domains:
     print("No valid resolved entries found in log.")
     exit(0)